@@ -1,15 +1,31 @@
 import sounddevice as sd    # Audio playback for generated speech
-import pyaudio             # Audio stream handling
-import json                # JSON parsing for file creation commands
+import numpy as np         # Audio sample arrays
+try:
+    import orjson as _json  # Fast JSON parsing for file creation commands
+except ImportError:
+    import json as _json    # Standard library fallback
 import logging             # Error logging and debugging
+import os                  # CPU count and model file lookup
+# Let PyTorch Kokoro layers without Apple Silicon kernels fall back to the CPU,
+# must be set before torch is first imported (RealtimeSTT imports it below)
+os.environ.setdefault("PYTORCH_ENABLE_MPS_FALLBACK", "1")
+import re                  # Sentence boundary detection for streamed responses
+import asyncio             # Pipelined response streaming, synthesis and playback
+import signal              # Ctrl+C handling while waiting at the prompt
+import functools           # Caching of per-sentence phoneme lookups
+import hashlib             # File names for pre-rendered phrase audio
+import onnxruntime         # Inference session backing the Kokoro model
+import psutil              # Physical core count for inference threads
 # Real-time speech-to-text conversion
 from RealtimeSTT import AudioToTextRecorder
 
+import spacy               # GPU check for misaki's transformer model
 from misaki import en, espeak  # Text-to-phoneme conversion for speech synthesis
 from kokoro_onnx import Kokoro  # Neural text-to-speech synthesis
 
+import httpx               # Persistent HTTP/2 connection to the API
 import anthropic           # Anthropic's Claude AI API
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic
 
 # Configuration constants
 AUDIO_SAMPLE_RATE = 16000   # Standard sample rate for audio processing (16kHz)
@@ -18,6 +34,51 @@ AGENT_NAME = "John"         # Display name for the AI assistant
 KOTORO_VOICE = "am_michael"
 # see https://huggingface.co/hexgrad/Kokoro-82M/tree/cddbcb284a842f5679b33f174250190463775a22/voices
 
+# Kokoro model files. The fp16 model is used when running on an NVIDIA GPU and
+# the int8 model on the CPU, falling back to the fp32 model if they are missing
+KOKORO_MODEL_PATH = "models/kokoro-v1.0.onnx"
+KOKORO_GPU_MODEL_PATH = "models/kokoro-v1.0.fp16-gpu.onnx"
+KOKORO_CPU_MODEL_PATH = "models/kokoro-v1.0.int8.onnx"
+KOKORO_VOICES_PATH = "models/voices-v1.0.bin"
+# Text-to-speech backend, "onnx" (kokoro-onnx) or "torch" (PyTorch Kokoro on CUDA/MPS)
+KOKORO_BACKEND = os.environ.get("KOKORO_BACKEND", "onnx")
+KOKORO_SAMPLE_RATE = 24000  # Kokoro always generates 24kHz audio
+SPEECH_AUDIO_QUEUE_SIZE = 4  # Synthesized sentences allowed to wait for playback
+SPEECH_PHONEME_QUEUE_SIZE = 4  # Converted sentences allowed to wait for synthesis
+SPEECH_BATCH_SIZE = 4  # Most waiting sentences synthesized in one inference
+KOKORO_MAX_PHONEMES = 510  # Longest phoneme string Kokoro synthesizes in one pass
+AUDIO_OUTPUT_BLOCKSIZE = 1024  # Frames per output stream buffer
+# Output sample format, "float32" or "int16" for audio devices that need integer samples
+AUDIO_OUTPUT_DTYPE = "float32"
+
+# Filler played when transcription is slow, so the user isn't left in silence
+FILLER_PHRASE = "One sec."
+FILLER_DELAY = 0.4  # Seconds to wait for the transcription before the filler plays
+
+# Stock phrases rendered once and played straight from memory
+CANNED_PHRASES = ["Hello!",
+                  "It seems you didn't say anything.",
+                  "It was good talking with you.",
+                  FILLER_PHRASE]
+CANNED_AUDIO_DIR = "models/canned"  # Pre-rendered phrase audio kept between runs
+# Phonemes synthesized at startup to warm up the model: a short input, then one
+# close to the 510 token limit so memory for long utterances is allocated up front
+KOKORO_WARMUP_PHONEMES = ["həlˈoʊ", " ".join(["həlˈoʊ"] * 70)]
+# ONNX Runtime graph execution mode. Kokoro's graph is mostly linear and G2P and
+# transcription share the cores, so "sequential" is the default, "parallel" is opt-in
+KOKORO_EXECUTION_MODE = os.environ.get("KOKORO_EXECUTION_MODE", "sequential")
+KOKORO_INTER_OP_THREADS = 2  # Threads running independent graph branches in parallel mode
+# ONNX Runtime execution providers in order of preference (GPU, Apple Neural Engine, CPU)
+KOKORO_PROVIDERS = ["CUDAExecutionProvider",
+                    "CoreMLExecutionProvider",
+                    "CPUExecutionProvider"]
+
+# Split point after sentence-ending punctuation, used to speak streamed responses early
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+# Braces delimiting file creation JSON blocks embedded in a response
+JSON_BRACE = re.compile(r"[{}]")
+G2P_CACHE_SIZE = 1024  # Distinct sentences to remember phonemes for
+
 # Set logging level to only show critical errors (reduces console noise)
 logging.basicConfig(level=logging.CRITICAL)
 
@@ -28,6 +89,12 @@ class AnthropicModelInterface:
     Manages conversation history, API authentication and and API calls
     """
 
+    # Most user/assistant exchanges sent to Claude, older ones are dropped
+    MAX_TURNS = 12
+    # Exchanges kept after trimming, dropping a block at once leaves the start of
+    # the history unchanged for several turns so the prompt cache can be reused
+    TRIMMED_TURNS = MAX_TURNS // 2
+
     def __init__(self, model_prompt_path="model-prompt.txt"):
         """
         Initialize the AI interface with system prompt and API credentials
@@ -48,29 +115,67 @@ class AnthropicModelInterface:
             print("No key provided")
             exit()
 
-        # Initialize the Anthropic client with API key
-        self.client = Anthropic(api_key=anthropic_api_key)
+        # Keep the connection to the API alive between turns so each call
+        # skips the TCP and TLS handshake
+        self._httpx = httpx.AsyncClient(
+            http2=True,
+            timeout=30.0,
+            limits=httpx.Limits(max_keepalive_connections=4,
+                                keepalive_expiry=60))
+
+        # Initialize the async Anthropic client with API key so the response
+        # can stream while speech is synthesized and played
+        self.client = AsyncAnthropic(api_key=anthropic_api_key,
+                                     http_client=self._httpx)
 
         # Store conversation history as a list of message objects
         self.conversation_log = []
 
-    def MakeAnthropicAPICall(self):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.Close()
+
+    async def Close(self):
+        """
+        Close the persistent connection to the API
         """
-        Send the current conversation to Claude and get a response
+        await self._httpx.aclose()
+
+    async def MakeAnthropicAPICall(self, on_sentence=None):
+        """
+        Send the current conversation to Claude and stream back the response
+        Each complete sentence is passed to on_sentence as soon as it arrives
+
+        Args:
+            on_sentence (callable): Called with each sentence of speakable text,
+                with file creation JSON already handled and removed
 
         Returns:
-            str: Claude's response text, or empty string if error occurs
+            str: Claude's full response text, or empty string if error occurs
         """
         try:
-            # Make API call to Claude with current conversation history
-            message = self.client.messages.create(
+            buffer = ""  # Streamed text not yet passed on as a sentence
+
+            # Stream API call to Claude with current conversation history
+            async with self.client.messages.stream(
                 model="claude-3-5-haiku-latest",  # Use the Haiku model for faster responses
                 max_tokens=1024,                  # Limit response length
                 temperature=1,                    # High creativity/randomness
                 system=self.system_prompt,        # System instructions for AI behavior
-                messages=self.conversation_log    # Full conversation history
-            )
-            return message.content[0].text
+                messages=self._CachedConversationLog()  # Full conversation history
+            ) as stream:
+                async for text in stream.text_stream:
+                    buffer += text
+                    if (on_sentence):
+                        buffer = FlushSentences(buffer, on_sentence)
+                response = await stream.get_final_text()
+
+            # Pass on whatever followed the last sentence boundary
+            if (on_sentence):
+                FlushSentences(buffer, on_sentence, final=True)
+            return response
 
         # Handle various API errors gracefully
         except anthropic.APIConnectionError as e:
@@ -86,6 +191,28 @@ class AnthropicModelInterface:
             print(e.response)
             return ""
 
+    def _CachedConversationLog(self):
+        """
+        Copy of the conversation history with a prompt cache breakpoint on its last block
+        The system prompt alone is too short to be cached, but the system prompt plus
+        the history is cached once it passes the minimum length, so the next turn
+        only processes the new messages. Each trim of the history changes the cached
+        prefix, so the cache is only reused between trims
+
+        Returns:
+            list: Message objects to send to Claude
+        """
+        if (not self.conversation_log):
+            return self.conversation_log
+
+        # Copy the last message so the breakpoint isn't kept in the stored history
+        last_message = self.conversation_log[-1]
+        content = [dict(block) for block in last_message["content"]]
+        content[-1]["cache_control"] = {"type": "ephemeral"}
+
+        return self.conversation_log[:-1] + [
+            {"role": last_message["role"], "content": content}]
+
     def AddUserMessage(self, text):
         """
         Add a user message to the conversation history
@@ -113,6 +240,15 @@ class AnthropicModelInterface:
                 }
             ]
         })
+        self.TrimConversationLog()
+
+    def TrimConversationLog(self):
+        """
+        Once the history passes MAX_TURNS exchanges, cut it back to the last TRIMMED_TURNS
+        Messages are dropped in user/assistant pairs so the log still starts with a user message
+        """
+        if (len(self.conversation_log) // 2 > self.MAX_TURNS):
+            del self.conversation_log[:-self.TRIMMED_TURNS * 2]
 
 
 def WriteJsonFile(string):
@@ -125,7 +261,7 @@ def WriteJsonFile(string):
     """
     try:
         # Parse the JSON string
-        f = json.loads(string)
+        f = _json.loads(string.encode())
 
         # Validate required fields are present
         if (not f["file"] or not f["text"]):
@@ -136,7 +272,7 @@ def WriteJsonFile(string):
         with open(f["file"], "w") as file:
             file.write(f["text"])
 
-    except json.JSONDecodeError as e:
+    except _json.JSONDecodeError as e:
         print(f"Malformed JSON: {string}")
         print(e)
 
@@ -152,35 +288,488 @@ def HandleFileCreationString(string):
     Returns:
         str: Cleaned response text with JSON commands removed
     """
-    in_json = False      # Track if we're inside a JSON block
-    idx = 0              # Current character index
-    start_idx = 0        # Start of current JSON block
-    json_to_replace = []  # List of JSON strings to remove from response
-
-    # Scan through the string character by character
-    for idx, value in enumerate(string):
-        if (not in_json and value == "{"):
-            # Found start of JSON block
-            in_json = True
-            start_idx = idx
+    kept_text = []  # Pieces of the response outside of JSON blocks
+    last_idx = 0    # End of the previous JSON block
+    start_idx = 0   # Start of current JSON block
+    depth = 0       # Nesting depth of braces, so braces inside the text are kept
+
+    # Jump from brace to brace in a single pass
+    for match in JSON_BRACE.finditer(string):
+        if (match.group() == "{"):
+            if (depth == 0):
+                # Found start of JSON block
+                start_idx = match.start()
+            depth += 1
+        elif (depth > 0):
+            depth -= 1
+            if (depth == 0):
+                # Found end of the outermost JSON block
+                # Process the JSON command (write file)
+                WriteJsonFile(string[start_idx:match.end()])
+
+                # Keep the text between the previous block and this one
+                kept_text.append(string[last_idx:start_idx])
+                last_idx = match.end()
+
+    # Keep the text after the last JSON block
+    kept_text.append(string[last_idx:])
+
+    return "".join(kept_text)
+
+
+def FlushSentences(buffer, on_sentence, final=False):
+    """
+    Pass every complete sentence in a streamed text buffer on to on_sentence
+    Text is held back while a file creation JSON block is still incomplete
+
+    Args:
+        buffer (str): Streamed text received so far
+        on_sentence (callable): Called with each complete sentence
+        final (bool): True once the stream has ended, flushes everything left
+
+    Returns:
+        str: Remaining text that does not yet form a complete sentence
+    """
+    if ("{" in buffer):
+        # Wait for the closing brace before handling the JSON block
+        if (not final and buffer.count("{") > buffer.count("}")):
+            return buffer
+        buffer = HandleFileCreationString(buffer)
+
+    # The last piece may still be mid-sentence unless the stream has ended
+    sentences = SENTENCE_BOUNDARY.split(buffer)
+    remainder = "" if final else sentences.pop()
+
+    for sentence in sentences:
+        # Strip so stock phrases match their pre-rendered audio exactly
+        sentence = sentence.strip()
+        if (sentence):
+            on_sentence(sentence)
+
+    return remainder
+
+
+class CachedG2P:
+    """
+    Wraps a G2P converter so each distinct sentence is only converted once
+    Whole sentences are converted so the G2P keeps the context it needs for
+    pronunciation, stress, numbers and symbols
+    """
+
+    def __init__(self, g2p):
+        """
+        Args:
+            g2p (callable): Grapheme-to-phoneme converter returning (phonemes, tokens)
+        """
+        self.g2p = g2p
+        self._SentenceToPhonemes = functools.lru_cache(
+            maxsize=G2P_CACHE_SIZE)(self._ConvertSentence)
+
+    def __call__(self, text):
+        """
+        Convert text to phonemes, reusing cached phonemes for repeated sentences
+
+        Args:
+            text (str): Text to convert
+
+        Returns:
+            tuple: (phonemes, None), matching the G2P call signature
+        """
+        return self._SentenceToPhonemes(text), None
+
+    def _ConvertSentence(self, text):
+        """
+        Run the wrapped G2P (and its espeak fallback) on the whole text
+        """
+        phonemes, _ = self.g2p(text)
+        return phonemes
+
+
+def ToInt16(samples):
+    """
+    Convert float audio samples in [-1, 1] to 16-bit integer samples
+    Done with whole-array NumPy operations, never a Python loop over samples
+
+    Args:
+        samples (numpy.ndarray): Float audio samples
+
+    Returns:
+        numpy.ndarray: int16 audio samples, clipped to the int16 range
+    """
+    return np.clip(samples * 32767, -32768, 32767).astype(np.int16)
+
+
+@functools.lru_cache(maxsize=None)
+def CreateG2P():
+    """
+    Create the text-to-phoneme converter, only built once per process
+    Misaki G2P (Grapheme-to-Phoneme) with espeak-ng fallback for unknown words
+    The transformer model uses the context of each whole sentence to pick better
+    phonemes, but is only fast enough on a GPU
+
+    Returns:
+        CachedG2P: American English phoneme converter
+    """
+    # Only use the transformer model if spaCy itself can run it on the GPU,
+    # this has to be set up before misaki loads the spaCy model
+    use_transformer = spacy.prefer_gpu()
+
+    fallback = espeak.EspeakFallback(british=False)
+    g2p = en.G2P(trf=use_transformer, british=False, fallback=fallback)
+
+    # Cache phonemes per sentence, the G2P always sees complete sentences
+    return CachedG2P(g2p)
+
+
+class SpeechPlayer:
+    """
+    Speaks text through a three stage asyncio pipeline so speaking never blocks the caller
+    While one sentence plays the next is being synthesized and the one after
+    that converted to phonemes, each stage running in the default executor
+    """
+
+    def __init__(self, g2p, kokoro):
+        """
+        Start the pipeline tasks, must be called from inside the running event loop
+
+        Args:
+            g2p (callable): Grapheme-to-phoneme converter
+            kokoro: Text-to-speech model providing create()
+        """
+        self.g2p = g2p
+        self.kokoro = kokoro
+
+        # Pre-rendered audio for stock phrases, keyed by text
+        self.canned_audio = {}
+
+        # Sentences waiting for phoneme conversion, in order
+        self.text_queue = asyncio.Queue()
+        # (text, phonemes) waiting for synthesis, phonemes are None for stock phrases
+        self.phoneme_queue = asyncio.Queue(maxsize=SPEECH_PHONEME_QUEUE_SIZE)
+        # Synthesized audio waiting to be played, bounded so synthesis stays only a little ahead
+        self.audio_queue = asyncio.Queue(maxsize=SPEECH_AUDIO_QUEUE_SIZE)
+
+        # One low latency output stream for the whole session, opening a
+        # stream per utterance adds delay and can glitch the audio device
+        self.output_stream = sd.OutputStream(samplerate=KOKORO_SAMPLE_RATE,
+                                             channels=1,
+                                             dtype=AUDIO_OUTPUT_DTYPE,
+                                             blocksize=AUDIO_OUTPUT_BLOCKSIZE,
+                                             latency="low")
+        self.output_stream.start()
+
+        self.tasks = [asyncio.create_task(self._PhonemeLoop()),
+                      asyncio.create_task(self._SynthesisLoop()),
+                      asyncio.create_task(self._PlaybackLoop())]
+
+    def PrepareCannedPhrases(self, phrases, model_name):
+        """
+        Render stock phrases to audio ahead of time so they play instantly
+        Audio is saved to disk so later runs can skip synthesis completely
+
+        Args:
+            phrases (list): Phrases to pre-render
+            model_name (str): Kokoro backend and model file, so audio from another model isn't reused
+        """
+        os.makedirs(CANNED_AUDIO_DIR, exist_ok=True)
+
+        for text in phrases:
+            # Name the file after the model, voice, format and text so changing any re-renders it
+            key = hashlib.sha1(
+                f"{model_name}:{KOTORO_VOICE}:{AUDIO_OUTPUT_DTYPE}:{text}".encode()).hexdigest()
+            path = os.path.join(CANNED_AUDIO_DIR, f"{key}.npy")
+
+            if (os.path.exists(path)):
+                self.canned_audio[text] = np.load(path, mmap_mode="r")
+            else:
+                phonemes, _ = self.g2p(text)
+                samples = self._Synthesize(phonemes)
+                np.save(path, samples)
+                self.canned_audio[text] = samples
+
+    def Say(self, text):
+        """
+        Queue text to be spoken, returns immediately
+
+        Args:
+            text (str): Text to speak
+        """
+        self.text_queue.put_nowait(text)
+
+    async def Wait(self):
+        """
+        Wait until everything queued so far has been spoken
+        """
+        # Each stage hands an item on before marking it done, so the stages drain in order
+        await self.text_queue.join()
+        await self.phoneme_queue.join()
+        await self.audio_queue.join()
+
+    def Close(self):
+        """
+        Stop the pipeline and close the audio output stream
+        """
+        for task in self.tasks:
+            task.cancel()
+        # Stop first so buffered audio finishes playing, closing alone discards it
+        self.output_stream.stop()
+        self.output_stream.close()
+
+    async def _PhonemeLoop(self):
+        """
+        First stage: convert queued sentences to phonemes forever
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            text = await self.text_queue.get()
+            try:
+                # Stock phrases are already rendered and skip conversion
+                phonemes = None
+                if (text not in self.canned_audio):
+                    phonemes, _ = await loop.run_in_executor(None, self.g2p, text)
+                await self.phoneme_queue.put((text, phonemes))
+            except Exception as e:
+                print(f"Could not convert to phonemes: {text}")
+                print(e)
+            finally:
+                self.text_queue.task_done()
+
+    async def _SynthesisLoop(self):
+        """
+        Second stage: convert phonemes to audio forever
+        Sentences that are already waiting are joined into a single inference
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            # Take the next sentence plus any others that are ready
+            batch = [await self.phoneme_queue.get()]
+            while (len(batch) < SPEECH_BATCH_SIZE
+                   and not self.phoneme_queue.empty()):
+                batch.append(self.phoneme_queue.get_nowait())
+
+            try:
+                for text, phonemes in self._MergeBatch(batch):
+                    try:
+                        if (phonemes is None):
+                            samples = self.canned_audio[text]
+                        else:
+                            samples = await loop.run_in_executor(
+                                None, self._Synthesize, phonemes)
+                        await self.audio_queue.put(samples)  # Waits while playback catches up
+                    except Exception as e:
+                        print(f"Could not speak: {text}")
+                        print(e)
+            finally:
+                for _ in batch:
+                    self.phoneme_queue.task_done()
+
+    def _MergeBatch(self, batch):
+        """
+        Join neighbouring sentences into as few syntheses as Kokoro's input limit allows
+        Stock phrases stay on their own so their pre-rendered audio is used
+
+        Args:
+            batch (list): (text, phonemes) items in speaking order
+
+        Returns:
+            list: (text, phonemes) items, in the same order
+        """
+        merged = []
+        for text, phonemes in batch:
+            if (phonemes is not None and merged and merged[-1][1] is not None
+                    and len(merged[-1][1]) + len(phonemes) < KOKORO_MAX_PHONEMES):
+                merged[-1] = (f"{merged[-1][0]} {text}",
+                              f"{merged[-1][1]} {phonemes}")
+            else:
+                merged.append((text, phonemes))
+        return merged
+
+    def _Synthesize(self, phonemes):
+        """
+        Convert phonemes to audio samples
+
+        Args:
+            phonemes (str): Phonemes to synthesize
+
+        Returns:
+            numpy.ndarray: Contiguous audio samples at KOKORO_SAMPLE_RATE in AUDIO_OUTPUT_DTYPE
+        """
+        samples, _ = self.kokoro.create(
+            phonemes, KOTORO_VOICE, is_phonemes=True)  # Generate audio
+        # Match the output stream format here so playback writes without copying,
+        # this only copies if Kokoro returned some other layout
+        if (AUDIO_OUTPUT_DTYPE == "int16"):
+            return ToInt16(samples)
+        return np.ascontiguousarray(samples, dtype=np.float32)
+
+    async def _PlaybackLoop(self):
+        """
+        Last stage: play synthesized audio back-to-back on the output stream
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            samples = await self.audio_queue.get()
+            try:
+                # Blocks until the audio is buffered, keeping sentences in order
+                await loop.run_in_executor(
+                    None, self.output_stream.write, samples)
+            except Exception as e:
+                print("Could not play audio")
+                print(e)
+            finally:
+                self.audio_queue.task_done()
+
+
+def SelectKokoroModel():
+    """
+    Pick the fastest available execution providers and the Kokoro model file to run on them
+    Uses the fp16 model on CUDA and the int8 model otherwise, when they are present
+
+    Returns:
+        tuple: (model_path, providers)
+    """
+    # Keep only the preferred providers this onnxruntime build supports
+    available_providers = onnxruntime.get_available_providers()
+    providers = [provider for provider in KOKORO_PROVIDERS
+                 if provider in available_providers]
+
+    # Reduced precision models are much faster, use them if they have been downloaded
+    if ("CUDAExecutionProvider" in providers):
+        model_path = KOKORO_GPU_MODEL_PATH
+    else:
+        model_path = KOKORO_CPU_MODEL_PATH
+    if (not os.path.exists(model_path)):
+        model_path = KOKORO_MODEL_PATH
+
+    return model_path, providers
+
+
+def CreateKokoro(model_path, providers):
+    """
+    Create the Kokoro text-to-speech model on the given execution providers
+
+    Args:
+        model_path (str): Kokoro ONNX model file
+        providers (list): ONNX Runtime execution providers in order of preference
+
+    Returns:
+        Kokoro: Text-to-speech model ready for synthesis
+    """
+    # Enable all graph optimizations and use one kernel thread per physical core,
+    # hyperthreads only compete for the same execution units
+    session_options = onnxruntime.SessionOptions()
+    session_options.graph_optimization_level = (
+        onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL)
+    session_options.intra_op_num_threads = (
+        psutil.cpu_count(logical=False) or os.cpu_count())
+
+    if (KOKORO_EXECUTION_MODE == "parallel"):
+        # Run independent branches of the graph at the same time, with idle threads
+        # spinning between kernels instead of sleeping (ignored on CUDA)
+        session_options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+        session_options.inter_op_num_threads = KOKORO_INTER_OP_THREADS
+        session_options.add_session_config_entry(
+            "session.intra_op.allow_spinning", "1")
+    else:
+        # Idle threads sleep so they don't take cores from G2P and transcription
+        session_options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        session_options.add_session_config_entry(
+            "session.intra_op.allow_spinning", "0")
+
+    session = onnxruntime.InferenceSession(
+        model_path, session_options, providers=providers)
+    return Kokoro.from_session(session, KOKORO_VOICES_PATH)
+
+
+def SplitPhonemes(phonemes):
+    """
+    Split a phoneme string into chunks Kokoro can synthesize in one pass
+    Chunks break at spaces, a single word longer than the limit is cut up
+
+    Args:
+        phonemes (str): Phonemes to split
+
+    Returns:
+        list: Phoneme strings of at most KOKORO_MAX_PHONEMES characters
+    """
+    chunks = []
+    current = ""
+    for word in phonemes.split():
+        candidate = f"{current} {word}" if current else word
+        if (len(candidate) <= KOKORO_MAX_PHONEMES):
+            current = candidate
             continue
-        elif (in_json and value == "}"):
-            # Found end of JSON block
-            in_json = False
-            json_content = string[start_idx:(idx+1)]
 
-            # Process the JSON command (write file)
-            WriteJsonFile(json_content)
+        # Start a new chunk, cutting up any word that can't fit in one
+        if (current):
+            chunks.append(current)
+        while (len(word) > KOKORO_MAX_PHONEMES):
+            chunks.append(word[:KOKORO_MAX_PHONEMES])
+            word = word[KOKORO_MAX_PHONEMES:]
+        current = word
+
+    if (current):
+        chunks.append(current)
+    return chunks
+
+
+class TorchKokoro:
+    """
+    Adapter running the PyTorch Kokoro model behind the same create() call as kokoro-onnx
+    Lets the rest of the program stay the same whichever backend is selected
+    """
+
+    def __init__(self):
+        """
+        Load the PyTorch Kokoro pipeline onto the GPU
+        """
+        # Imported here so torch is only needed when this backend is selected
+        import torch
+        import kokoro
+
+        # Prefer an NVIDIA GPU, then Apple Silicon, then the CPU
+        if torch.cuda.is_available():
+            device = "cuda"
+        elif torch.backends.mps.is_available():
+            device = "mps"
+        else:
+            device = "cpu"
+
+        # American English pipeline, phonemes are supplied by our own G2P
+        self.pipeline = kokoro.KPipeline(lang_code="a", device=device)
+
+    def create(self, phonemes, voice, is_phonemes=True):
+        """
+        Generate audio for a phoneme string
+
+        Args:
+            phonemes (str): Phonemes to synthesize
+            voice (str): Kokoro voice name
+            is_phonemes (bool): Kept for compatibility with kokoro-onnx, input is always phonemes
+
+        Returns:
+            tuple: (samples, sample_rate) with samples as a float32 numpy array
+        """
+        # The pipeline rejects phoneme strings over Kokoro's limit, so split them first
+        chunks = [result.audio.cpu().numpy()
+                  for phoneme_chunk in SplitPhonemes(phonemes)
+                  for result in self.pipeline.generate_from_tokens(
+                      tokens=phoneme_chunk, voice=voice)]
+        if (not chunks):
+            return np.zeros(0, dtype=np.float32), KOKORO_SAMPLE_RATE
+        return np.concatenate(chunks), KOKORO_SAMPLE_RATE
 
-            # Mark this JSON for removal from response text
-            json_to_replace.append(json_content)
 
-    # Remove all JSON commands from the response text
-    scrubbed_string = string
-    for json_string in json_to_replace:
-        scrubbed_string = scrubbed_string.replace(json_string, "")
+def WarmUpKokoro(kokoro):
+    """
+    Run throwaway syntheses so the first real one doesn't pay for kernel
+    selection and memory allocation
 
-    return scrubbed_string
+    Args:
+        kokoro: Text-to-speech model providing create()
+    """
+    for phonemes in KOKORO_WARMUP_PHONEMES:
+        kokoro.create(phonemes, KOTORO_VOICE, is_phonemes=True)
 
 
 def CheckForTerminate(string):
@@ -196,6 +785,19 @@ def CheckForTerminate(string):
     return "It was good talking with you." in string
 
 
+def WaitForKeyPress():
+    """
+    Block until the user presses enter, letting Ctrl+C interrupt the wait
+    Under asyncio.run the first Ctrl+C only cancels the main task, which a
+    blocking input() never notices, so raise KeyboardInterrupt directly instead
+    """
+    previous_handler = signal.signal(signal.SIGINT, signal.default_int_handler)
+    try:
+        input("")
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+
+
 def PrintAgent(string):
     """
     Print the AI agent's message with formatting
@@ -216,7 +818,7 @@ def PrintUser(string):
     print(f"User says: \n \"{string}\" \n")
 
 
-if __name__ == "__main__":
+async def Main():
     """
     Main program loop - sets up all components and runs the voice interaction loop
     """
@@ -224,13 +826,17 @@ if __name__ == "__main__":
     print("Setting Up")
 
     # Initialize text-to-phoneme conversion system
-    # Misaki G2P (Grapheme-to-Phoneme) with espeak-ng fallback for unknown words
-    # Use American English pronunciation
-    fallback = espeak.EspeakFallback(british=False)
-    g2p = en.G2P(trf=False, british=False, fallback=fallback)
-
-    # Initialize neural text-to-speech system (Kokoro)
-    kokoro = Kokoro("models/kokoro-v1.0.onnx", "models/voices-v1.0.bin")
+    g2p = CreateG2P()
+
+    # Initialize neural text-to-speech system (Kokoro) on GPU when available
+    if (KOKORO_BACKEND == "torch"):
+        kokoro = TorchKokoro()
+        kokoro_model_name = "torch"
+    else:
+        model_path, providers = SelectKokoroModel()
+        kokoro = CreateKokoro(model_path, providers)
+        kokoro_model_name = f"onnx:{model_path}"
+    WarmUpKokoro(kokoro)  # Keep the first inference stall out of the conversation
 
     # Legacy Vosk speech recognition setup (commented out, replaced by RealtimeSTT)
     # vosk.SetLogLevel(-1)  # Suppress Vosk logging
@@ -240,72 +846,80 @@ if __name__ == "__main__":
     # Initialize modern real-time speech-to-text recorder
     recorder = AudioToTextRecorder()
 
-    # Initialize the Claude AI interface
-    anthropic_interface = AnthropicModelInterface()
-
-    # Clear screen and announce startup
-    print("\033[H\033[J", end="")  # ANSI escape codes to clear terminal
-    print(f"{AGENT_NAME} has joined")
-
-    # Say hello
-    phonemes, _ = g2p("Hello!")  # Convert text to phonemes
-    samples, sample_rate = kokoro.create(
-        phonemes, KOTORO_VOICE, is_phonemes=True)  # Generate audio
-    sd.play(samples, sample_rate)  # Play the audio
-    sd.wait()  # Wait for playback to complete
-
-    # Initialize PyAudio for microphone access
-    p = pyaudio.PyAudio()
-    # Debug line to check audio device info (commented out)
-    # print(p.get_device_info_by_index(1))
-    # exit()
+    # Speak through a pipeline so conversion, synthesis and playback overlap the streamed response
+    speaker = SpeechPlayer(g2p, kokoro)
 
     try:
-        # Main conversation loop - continues until interrupted or terminated
-        while True:
-            heard_text = ""
-            print(f"{AGENT_NAME} is listening. Press any key to stop listening")
-
-            # Start recording audio from microphone
-            recorder.start()
-            input("")  # Wait for user to press any key to stop recording
-            recorder.stop()
-            heard_text = recorder.text()  # Get transcribed text
-
-            # Handle case where no speech was detected
-            if (not heard_text):
-                # Generate and play error message
-                phonemes, _ = g2p("It seems you didn't say anything.")
-                samples, sample_rate = kokoro.create(
-                    phonemes, KOTORO_VOICE, is_phonemes=True)
-                sd.play(samples, sample_rate)
-                sd.wait()
-                continue  # Skip to next iteration
-
-            # Process the user's speech
-            PrintUser(heard_text)  # Display what user said
-            anthropic_interface.AddUserMessage(
-                heard_text)  # Add to conversation history
-            response = anthropic_interface.MakeAnthropicAPICall()  # Get AI response
-            anthropic_interface.AddAgentMessage(
-                response)  # Add AI response to history
-
-            # Process the AI response for file creation commands
-            text_to_say = (HandleFileCreationString(response))
-            PrintAgent(text_to_say)  # Display cleaned response
-
-            # Generate and play speech if there's text to say
-            if (text_to_say):
-                phonemes, _ = g2p(text_to_say)
-                samples, sample_rate = kokoro.create(
-                    phonemes, KOTORO_VOICE, is_phonemes=True)  # Generate audio
-                sd.play(samples, sample_rate)  # Play the audio
-                sd.wait()  # Wait for completion
+        speaker.PrepareCannedPhrases(CANNED_PHRASES, kokoro_model_name)
+
+        # Initialize the Claude AI interface, its connection is closed on exit
+        async with AnthropicModelInterface() as anthropic_interface:
+            # Clear screen and announce startup
+            print("\033[H\033[J", end="")  # ANSI escape codes to clear terminal
+            print(f"{AGENT_NAME} has joined")
+
+            # Say hello
+            speaker.Say("Hello!")
+            await speaker.Wait()  # Wait for playback to complete
+
+            # Main conversation loop - continues until interrupted or terminated
+            while True:
+                heard_text = ""
+                print(f"{AGENT_NAME} is listening. Press any key to stop listening")
+
+                # Start recording audio from microphone
+                recorder.start()
+                WaitForKeyPress()  # Wait for user to press any key to stop recording
+                recorder.stop()
+
+                # Transcribe in the background, speaking a filler if it takes a while
+                transcription = asyncio.get_running_loop().run_in_executor(
+                    None, recorder.text)
+                done, _ = await asyncio.wait([transcription], timeout=FILLER_DELAY)
+                if (not done):
+                    speaker.Say(FILLER_PHRASE)
+                heard_text = await transcription  # Get transcribed text
+
+                # Handle case where no speech was detected
+                if (not heard_text):
+                    # Generate and play error message
+                    speaker.Say("It seems you didn't say anything.")
+                    await speaker.Wait()
+                    continue  # Skip to next iteration
+
+                # Process the user's speech
+                PrintUser(heard_text)  # Display what user said
+                anthropic_interface.AddUserMessage(
+                    heard_text)  # Add to conversation history
+
+                # Speak each sentence as soon as Claude finishes it
+                # File creation commands are handled while streaming
+                spoken_sentences = []
+
+                def SaySentence(sentence):
+                    spoken_sentences.append(sentence)
+                    speaker.Say(sentence)
+
+                response = await anthropic_interface.MakeAnthropicAPICall(
+                    SaySentence)  # Get AI response
+                anthropic_interface.AddAgentMessage(
+                    response)  # Add AI response to history
+
+                text_to_say = " ".join(spoken_sentences)
+                PrintAgent(text_to_say)  # Display cleaned response
+                await speaker.Wait()  # Wait for completion
 
                 # Check if AI wants to end the conversation
                 if CheckForTerminate(text_to_say):
-                    exit()  # Terminate program
+                    return  # Terminate program
+
+    finally:
+        speaker.Close()  # Close the audio output stream
+
 
+if __name__ == "__main__":
+    try:
+        asyncio.run(Main())
     except KeyboardInterrupt:
         # Handle Ctrl+C gracefully
         exit()